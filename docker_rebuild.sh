@@ -43,6 +43,13 @@ else
     echo "Performing Incremental Build (Faster)..."
 fi
 
+# Forward the nnedi3_resample pin from the environment when it is set there
+for pin in NNEDI3_RESAMPLE_COMMIT NNEDI3_RESAMPLE_SHA256; do
+    if [[ -n "${!pin:-}" ]]; then
+        BUILD_ARGS+=" --build-arg $pin=${!pin}"
+    fi
+done
+
 # Build the container capturing output for troubleshooting 
 if ! docker build $BUILD_ARGS -t $IMAGE_NAME:$TAG . 2>&1 | tee build_log.txt; then
     echo "!!! BUILD FAILED !!!"
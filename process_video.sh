@@ -2,13 +2,14 @@
 # ==============================================================================
 # VIDEO RECONSTRUCTION ENGINE - PRODUCTION WRAPPER
 # ==============================================================================
-# Dependency: docker, realpath
+# Dependency: docker, realpath (nc with Unix socket support for -D)
 # ==============================================================================
 
 set -e # Exit on error
 
 # --- Default Configuration ---
 IMAGE_NAME="video-reconstruction-engine"
+DAEMON_LABEL="video-reconstruction-daemon"
 COUNT=1
 STEP=1
 SCALE=1
@@ -17,7 +18,14 @@ FAST=0
 MODE="composite"
 DENOISE="medium"
 DENOISE_STAGE="pre"
+DENOISER="fft3d"
 STABILIZE=0
+SINK="png"
+PNG_COMPRESSION=1
+TARGET="still"
+QUALITY="slower"
+GPU_DEVICE=0
+DAEMON=0
 TFF="" 
 
 # Dependency Check
@@ -52,8 +60,22 @@ OUTPUT OPTIONS:
       
   -r  Resizer algorithm (Default: $RESIZER)
       • nnedi3_resample : Neural network (best quality, slower)
+      • spline64        : fmtconv Spline64 (near-NNEDI3 on smooth footage,
+                          much faster)
       • lanczos         : Sharp edges (good quality, fast)
       • bicubic         : Standard (balanced)
+      NNEDI3 runs on the GPU when the nnedi3cl (OpenCL) plugin is available
+
+  -G  GPU device index for GPU filters (Default: $GPU_DEVICE)
+      OpenCL device for nnedi3cl, CUDA device for -n dfttest2_cuda
+
+  -k  Output sink (Default: $SINK)
+      • png  : One PNG file per extracted frame
+      • pipe : Stream all frames into a single lossless MKV via ffmpeg
+               (faster for long sequences that will be re-encoded anyway)
+
+  -l  PNG compression level 1-9 (Default: $PNG_COMPRESSION)
+      1 writes fastest; higher levels give somewhat smaller files
 
 PROCESSING OPTIONS:
   -d  Denoise strength (Default: $DENOISE)
@@ -63,6 +85,11 @@ PROCESSING OPTIONS:
   -g  Denoise stage (Default: $DENOISE_STAGE)
       • pre  : Before deinterlacing (improves motion vectors)
       • post : After deinterlacing (preserves detail)
+
+  -n  Denoiser backend (Default: $DENOISER)
+      • fft3d        : FFT3D (neo_fft3d AVX2 build when available)
+      • dfttest2_cuda: dfttest2 on an NVIDIA GPU (cuFFT)
+      • dfttest2_cpu : dfttest2 AVX2 CPU backend
       
   -x  Stabilization (Default: $STABILIZE)
       • 0 : Off
@@ -79,8 +106,26 @@ EXTRACTION OPTIONS:
       • Omit to auto-detect from video metadata
       
   -z  Fast mode (Default: $FAST)
-      • 0 : Use "Very Slow" QTGMC preset (best quality)
-      • 1 : Use "Fast" preset (quick preview)
+      • 0 : Use the QTGMC preset selected by -q
+      • 1 : Use "Fast" preset (quick preview, same as -q fast)
+
+  -q  QTGMC quality preset (Default: $QUALITY)
+      placebo | veryslow | slower | slow | medium | fast
+      Only placebo enables SourceMatch=3 + Lossless=2 (up to 3x slower)
+
+  -T  Deinterlace target (Default: $TARGET)
+      • still : Disable sharpening and cap the final temporal smoothing
+                at TR2=1 (never raises the -q preset's values)
+                (tuned for single-frame extraction)
+      • video : Full temporal processing of the selected preset
+
+  -D  Daemon (Default: $DAEMON)
+      • 0 : Send the request to a running daemon if one is live for the
+            input's directory, otherwise run a one-shot container
+      • 1 : Start the daemon first if none is running. It keeps the
+            VapourSynth core, plugins and opened sources alive, so follow-up
+            commands on the same file skip startup and re-indexing.
+            Stop it with: docker stop \$(docker ps -q --filter label=$DAEMON_LABEL)
 
 FRAME DISCOVERY WORKFLOW:
   To find the best frame in a sequence, use -c (count) and -p (step) to
@@ -141,7 +186,7 @@ EOF
 }
 
 # --- Argument Parsing ---
-while getopts "i:f:c:p:s:r:m:d:g:x:t:z:h" opt; do
+while getopts "i:f:c:p:s:r:m:d:g:n:x:t:z:k:l:T:q:G:D:h" opt; do
     case $opt in
         i) INPUT_FILE=$(realpath "$OPTARG") ;;
         f) INPUT_VAL="$OPTARG" ;;
@@ -152,9 +197,16 @@ while getopts "i:f:c:p:s:r:m:d:g:x:t:z:h" opt; do
         m) MODE="$OPTARG" ;;
         d) DENOISE="$OPTARG" ;;
         g) DENOISE_STAGE="$OPTARG" ;;
+        n) DENOISER="$OPTARG" ;;
         x) STABILIZE="$OPTARG" ;;
         t) TFF="$OPTARG" ;;
         z) FAST="$OPTARG" ;;
+        k) SINK="$OPTARG" ;;
+        l) PNG_COMPRESSION="$OPTARG" ;;
+        T) TARGET="$OPTARG" ;;
+        q) QUALITY="$OPTARG" ;;
+        G) GPU_DEVICE="$OPTARG" ;;
+        D) DAEMON="$OPTARG" ;;
         h|*) usage ;;
     esac
 done
@@ -181,7 +233,13 @@ PY_CMD=(
     --mode "$MODE"
     --denoise "$DENOISE"
     --denoise-stage "$DENOISE_STAGE"
+    --denoiser "$DENOISER"
     --stabilize "$STABILIZE"
+    --quality "$QUALITY"
+    --target "$TARGET"
+    --gpu-device "$GPU_DEVICE"
+    --sink "$SINK"
+    --png-compression "$PNG_COMPRESSION"
 )
 
 # Handle conditional flags
@@ -189,11 +247,81 @@ PY_CMD=(
 [[ "$FAST" == "1" ]] && PY_CMD+=(--fast)
 [[ -n "$TFF" ]] && PY_CMD+=(--tff "$TFF")
 
+DOCKER_ARGS=(
+    -v "$(pwd):/src"
+    -v "$DATA_DIR:/data"
+    -v "/etc/localtime:/etc/localtime:ro"
+    -v "/etc/timezone:/etc/timezone:ro"
+    -u "$(id -u):$(id -g)"
+)
+
+# --- Daemon Forwarding ---
+# One daemon per data directory; its socket lives on the shared /data mount.
+SOCK="$DATA_DIR/.process_video.sock"
+
+daemon_live() {
+    [[ -S "$SOCK" ]] && command -v nc &> /dev/null && nc -zU "$SOCK" &> /dev/null
+}
+
+json_str() {
+    # JSON string literal: escape \ and " and emit control characters (tabs,
+    # newlines, ...) as \u00XX so the request stays valid and on one line
+    local s=$1 out="" c i
+    for (( i = 0; i < ${#s}; i++ )); do
+        c=${s:i:1}
+        case "$c" in
+            \\) out+='\\' ;;
+            \") out+='\"' ;;
+            [[:cntrl:]]) printf -v c '\\u%04x' "'$c"; out+=$c ;;
+            *) out+=$c ;;
+        esac
+    done
+    printf '"%s"' "$out"
+}
+
+if [[ "$DAEMON" == "1" ]] && ! daemon_live; then
+    if ! command -v nc &> /dev/null; then
+        echo "Error: -D 1 requires 'nc' with Unix socket support (-U)."
+        exit 1
+    fi
+    echo "Starting daemon on $SOCK"
+    docker run -d --rm --label "$DAEMON_LABEL" "${DOCKER_ARGS[@]}" \
+        "$IMAGE_NAME:latest" python3 /src/process_video.py \
+        --daemon --socket /data/.process_video.sock > /dev/null
+    for _ in $(seq 60); do
+        daemon_live && break
+        sleep 1
+    done
+fi
+
+if daemon_live; then
+    REQ="["
+    for arg in "${PY_CMD[@]:2}"; do
+        [[ "$REQ" != "[" ]] && REQ+=","
+        REQ+=$(json_str "$arg")
+    done
+    REQ+="]"
+    # Relay the daemon's output and exit with the status from its final
+    # marker line, the way a one-shot run would. Only fall back to a
+    # standalone run if the daemon sent nothing at all.
+    EXIT_MARKER="__PROCESS_VIDEO_EXIT__"
+    STATUS=""
+    GOT_OUTPUT=0
+    while IFS= read -r line; do
+        GOT_OUTPUT=1
+        if [[ "$line" == "$EXIT_MARKER "* ]]; then
+            STATUS=${line#"$EXIT_MARKER "}
+        else
+            printf '%s\n' "$line"
+        fi
+    done < <(printf '%s\n' "$REQ" | nc -U "$SOCK")
+    [[ -n "$STATUS" ]] && exit "$STATUS"
+    if [[ "$GOT_OUTPUT" == "1" ]]; then
+        echo "Error: Lost the connection to the daemon on $SOCK mid-request."
+        exit 1
+    fi
+    echo "Daemon on $SOCK did not respond; running standalone."
+fi
+
 # --- Execute Container ---
-exec docker run --rm \
-    -v "$(pwd):/src" \
-    -v "$DATA_DIR:/data" \
-    -v "/etc/localtime:/etc/localtime:ro" \
-    -v "/etc/timezone:/etc/timezone:ro" \
-    -u "$(id -u):$(id -g)" \
-    "$IMAGE_NAME:latest" "${PY_CMD[@]}"
+exec docker run --rm "${DOCKER_ARGS[@]}" "$IMAGE_NAME:latest" "${PY_CMD[@]}"
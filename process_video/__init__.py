@@ -0,0 +1,12 @@
+"""
+Video Reconstruction Engine pipeline package.
+
+The VapourSynth graph assembly and extraction logic lives in ``_core`` and
+the persistent socket server in ``_daemon``; the process_video.py script at
+the repository root is a thin CLI wrapper.
+"""
+
+from ._core import LOG_FORMAT, build_argparser, process_args, process_frame
+from ._daemon import serve
+
+__all__ = ["LOG_FORMAT", "build_argparser", "process_args", "process_frame", "serve"]
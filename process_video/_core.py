@@ -0,0 +1,930 @@
+"""
+Shared pipeline core for the Video Reconstruction Engine.
+
+Holds the filter graph assembly, frame extraction and CLI argument handling
+used by the process_video.py entry point. Importing this module does not
+mutate global VapourSynth or logging state; that is left to the entry point.
+"""
+
+import argparse
+import concurrent.futures
+import datetime
+import fcntl
+import functools
+import logging
+import math
+import os
+import queue
+import re
+import subprocess
+import sys
+import threading
+from collections import OrderedDict
+from fractions import Fraction
+from typing import Optional, Tuple, Dict, List
+
+import vapoursynth as vs
+
+logger = logging.getLogger(__name__)
+
+# Shared by the CLI entry point and the daemon's per-request log handler
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+# -----------------------------------------------------------------------------
+# VapourSynth Environment Initialization
+# -----------------------------------------------------------------------------
+core = vs.core
+
+# Optional OpenCL NNEDI3 build, detected once at startup
+HAS_NNEDI3CL = hasattr(core, "nnedi3cl")
+
+
+@functools.lru_cache(maxsize=None)
+def _havsfunc():
+    """
+    Imports havsfunc on first use.
+    
+    havsfunc pulls in mvsfunc and friends on import; only pay for that when a
+    deinterlaced output is actually requested, and only once per process.
+    """
+    import havsfunc
+    return havsfunc
+
+# -----------------------------------------------------------------------------
+# Helper Functions
+# -----------------------------------------------------------------------------
+
+def to_pascal_case(text: str) -> str:
+    """
+    Normalizes a filename to PascalCase for cross-platform CLI safety.
+    
+    Splits input on whitespace, underscores, or dashes to ensure robust
+    normalization regardless of source naming convention.
+    """
+    parts = re.split(r"[\s_-]+", text)
+    return "".join(p.capitalize() for p in parts if p)
+
+
+def detect_matrix(width: int) -> str:
+    """
+    Infers the correct color matrix based on output frame width.
+    
+    Uses BT.601 for Standard Definition (SD) and BT.709 for High Definition (HD)
+    to prevent chroma shifts during RGB conversion.  '170m' is the formal name
+    for BT.601/NTSC. Taking the width rather than a clip lets callers pick the
+    matrix before the scaling resize is built.
+    """
+    return "709" if width >= 1280 else "170m"
+
+
+# Field order per source version; see source_key() and detect_field_order().
+_field_order_cache: Dict[str, bool] = {}
+
+# Seconds to wait for frame 0 before giving up on field-order detection
+FIELD_PROBE_TIMEOUT = 10.0
+
+
+def detect_field_order(video: vs.VideoNode, source_id: str) -> bool:
+    """
+    Infers top-field-first from the source's _FieldBased frame property.
+    
+    Field order is a stream-level property, so frame 0 answers for the
+    whole title without seeking and decoding deep into the file. The probe
+    is time-limited; if frame 0 does not arrive, TFF is assumed (and not
+    cached). The result is cached per source.
+    """
+    if source_id in _field_order_cache:
+        return _field_order_cache[source_id]
+
+    try:
+        props = video.get_frame_async(0).result(timeout=FIELD_PROBE_TIMEOUT).props
+    except concurrent.futures.TimeoutError:
+        logger.warning(
+            f"Field order probe timed out after {FIELD_PROBE_TIMEOUT:.0f}s. "
+            "ASSUMING TFF - pass --tff 0 (-t 0) if the source is BFF."
+        )
+        return True
+
+    fb = props.get('_FieldBased', 2)
+    if fb == 1:
+        tff = False
+        logger.info("Detected field order: BFF")
+    elif fb == 2:
+        tff = True
+        logger.info("Detected field order: TFF")
+    elif fb == 0:
+        logger.warning("Source is progressive (_FieldBased=0). Using TFF as default for QTGMC compatibility.")
+        tff = True
+    else:
+        logger.warning(f"Unknown _FieldBased value: {fb}. Defaulting to TFF.")
+        tff = True
+
+    _field_order_cache[source_id] = tff
+    return tff
+
+
+def apply_stabilization(clip: vs.VideoNode, enable: bool) -> vs.VideoNode:
+    """
+    Applies global motion stabilization via DePan internal estimator.
+    
+    Uses range=8 and trust=0.5 optimized for family camcorder footage.
+    """
+    if not enable:
+        return clip
+    try:
+        logger.info("Applying global motion stabilization (DePan: range=8, trust=0.5)")
+        mdata = core.depan.DePanEstimate(clip, range=8, trust=0.5)
+        return core.depan.DePan(clip, data=mdata, offset=0.5, mirror=1)
+    except Exception as e:
+        logger.error(f"Stabilization failed: {e}")
+        return clip
+
+
+# Denoise strengths as FFT3D sigma (also QTGMC's EZDenoise scale)
+_STRENGTH_MAP: Dict[str, float] = {
+    "none": 0.0, "light": 1.0, "medium": 2.0, "heavy": 3.5
+}
+
+
+def apply_noise_reduction(
+    clip: vs.VideoNode, strength: str, denoiser: str, gpu_device: int = 0
+) -> vs.VideoNode:
+    """
+    Applies temporal noise reduction using FFT3DFilter or dfttest2.
+    
+    Uses bt=4 for a larger temporal radius, which provides better stability
+    for archival footage with consistent background noise. 48x48 blocks with
+    25% overlap need roughly half the FFTs of 32x32 at 50% overlap. The AVX2
+    neo_fft3d fork is preferred when it is installed.
+    
+    The dfttest2 denoisers (CUDA cuFFT on device gpu_device, or AVX2 CPU
+    backend) use tbsize=3 and fall back to FFT3D when the module is
+    unavailable.
+    """
+    # argparse already restricts the choices; an unknown strength is a bug
+    sigma = _STRENGTH_MAP[strength]
+    
+    if sigma == 0.0:
+        return clip
+
+    if denoiser in ("dfttest2_cuda", "dfttest2_cpu"):
+        try:
+            import dfttest2
+        except ImportError:
+            logger.warning("dfttest2 module not found. Falling back to FFT3D.")
+        else:
+            backend = (
+                dfttest2.Backend.cuFFT(device_id=gpu_device) if denoiser == "dfttest2_cuda"
+                else dfttest2.Backend.CPU()
+            )
+            # DFTTest's sigma scale is ~4x FFT3D's (its default of 8 matches
+            # FFT3D's default of 2), so strengths line up across denoisers.
+            return dfttest2.DFTTest(clip, sigma=sigma * 4, tbsize=3, backend=backend)
+        
+    try:
+        return core.neo_fft3d.FFT3D(
+            clip, sigma=sigma, bt=4, bw=48, bh=48, ow=12, oh=12, ncpu=os.cpu_count()
+        )
+    except AttributeError:
+        pass
+
+    try:
+        return core.fft3dfilter.FFT3DFilter(
+            clip, sigma=sigma, bt=4, bw=48, bh=48, ow=12, oh=12
+        )
+    except AttributeError:
+        logger.warning("FFT3DFilter plugin not found. Skipping denoise.")
+        return clip
+
+
+def png_writer(
+    clip: vs.VideoNode, path: str, firstnum: int = 0, compression: int = 1
+) -> vs.VideoNode:
+    """
+    Wraps an RGB24 clip in a PNG writer node.
+    
+    Prefers the fpng plugin, whose custom DEFLATE encodes several times faster
+    than libpng + zlib at similar file sizes, and falls back to imwri.
+    
+    compression is a zlib-style level (1-9). fpng only has a fast (0) and a
+    slow (1) mode (2 writes uncompressed and is never used), so levels 6 and
+    up select the slow one. For imwri the level
+    becomes ImageMagick's PNG quality: tens digit = zlib level, 5 = adaptive
+    row filtering.
+    """
+    try:
+        return core.fpng.Write(
+            clip, filename=path, firstnum=firstnum, compression=0 if compression < 6 else 1
+        )
+    except AttributeError:
+        return core.imwri.Write(
+            clip, "png", path, firstnum=firstnum, quality=compression * 10 + 5
+        )
+
+
+def pipe_to_ffmpeg(
+    clip: vs.VideoNode,
+    path: str,
+    prefetch: int,
+    backlog: int,
+    threads: int
+) -> None:
+    """
+    Streams an RGB24 clip as raw planar video into a lossless ffmpeg encode.
+    
+    Avoids one PNG DEFLATE and file creation per frame when extracting long
+    sequences. Planes are reordered to ffmpeg's gbrp layout by ShufflePlanes,
+    which references the planes rather than copying them.
+    """
+    gbr = core.std.ShufflePlanes(clip, planes=[1, 2, 0], colorfamily=vs.RGB)
+    cmd = [
+        "ffmpeg", "-hide_banner", "-loglevel", "error", "-y",
+        "-f", "rawvideo", "-pix_fmt", "gbrp",
+        "-s", f"{clip.width}x{clip.height}",
+        "-r", f"{clip.fps.numerator}/{clip.fps.denominator}",
+        "-i", "-",
+        "-c:v", "libx264rgb", "-crf", "0", "-preset", "veryfast",
+        "-threads", str(threads),
+        path
+    ]
+    proc = subprocess.Popen(cmd, stdin=subprocess.PIPE)
+
+    # Grow the pipe to 1 MiB (Linux only) so large frames don't stall on the
+    # default 64 KiB buffer.
+    try:
+        fcntl.fcntl(proc.stdin.fileno(), getattr(fcntl, "F_SETPIPE_SZ", 1031), 1 << 20)
+    except OSError:
+        pass
+
+    # Pipe writes run on a helper thread behind a bounded queue: ffmpeg needs
+    # frames in order, but VS keeps rendering ahead while the previous frame
+    # drains (blocking pipe writes release the GIL). The queue bound is the
+    # backpressure when the encoder falls behind.
+    pending: queue.Queue = queue.Queue(maxsize=backlog)
+    errors: List[OSError] = []
+
+    def drain() -> None:
+        while True:
+            frame = pending.get()
+            if frame is None:
+                return
+            if errors:
+                continue
+            # readchunks() yields memoryviews straight into the frame's planes
+            # (one per row when the stride is padded), so nothing is copied.
+            try:
+                for chunk in frame.readchunks():
+                    proc.stdin.write(chunk)
+            except OSError as e:
+                errors.append(e)
+
+    writer = threading.Thread(target=drain, daemon=True)
+    writer.start()
+    try:
+        # Frames are not closed eagerly here: the queue holds the reference
+        # until the helper thread has written them out.
+        for frame in gbr.frames(prefetch=prefetch, backlog=backlog):
+            if errors:
+                break
+            pending.put(frame)
+    finally:
+        pending.put(None)
+        writer.join()
+        try:
+            proc.stdin.close()
+        except BrokenPipeError:
+            pass
+        proc.wait()
+
+    if proc.returncode != 0:
+        raise RuntimeError(f"ffmpeg exited with status {proc.returncode}")
+    if errors:
+        raise errors[0]
+
+# -----------------------------------------------------------------------------
+# Source Loading
+# -----------------------------------------------------------------------------
+
+# Opened ffms2 sources keyed by (path, mtime), least recently used first. In
+# daemon mode this keeps the indexed VideoNode alive across requests on the
+# same file; a rewritten file gets a new mtime and is reopened. Only a few
+# sources are kept so a long batch session over many files stays bounded.
+SOURCE_CACHE_SIZE = 4
+_source_cache: "OrderedDict[Tuple[str, float], vs.VideoNode]" = OrderedDict()
+
+
+def source_key(file_path: str, mtime: float) -> str:
+    """
+    Identifies one version of a source file for the downstream caches.
+    
+    Field order and QTGMC graphs are keyed by this (plus the decode window
+    for QTGMC), so they never outlive the ffms2 node they were built from.
+    """
+    return f"{file_path}@{mtime}"
+
+
+def _evict_source(key: Tuple[str, float]) -> None:
+    """Drops a cached source with the field order and QTGMC graphs built on it."""
+    del _source_cache[key]
+    sid = source_key(*key)
+    _field_order_cache.pop(sid, None)
+    for qkey in [q for q in _qtgmc_cache if q[0].startswith(sid + ":")]:
+        del _qtgmc_cache[qkey]
+
+
+def open_source(file_path: str, mtime: float, cachefile: str) -> vs.VideoNode:
+    """
+    Opens a source through ffms2, reusing a previously opened node.
+    
+    The ffms2 index is persisted at cachefile so repeat runs skip indexing,
+    and FFmpeg's automatic decode thread count (threads=0) is requested where
+    the plugin build accepts it. Opening a newer version of a file, or more
+    than SOURCE_CACHE_SIZE files, evicts the stale or least recently used
+    node along with the field order and QTGMC graphs built on it.
+    """
+    key = (file_path, mtime)
+    if key in _source_cache:
+        _source_cache.move_to_end(key)
+    else:
+        for stale in [k for k in _source_cache if k[0] == file_path]:
+            _evict_source(stale)
+        while len(_source_cache) >= SOURCE_CACHE_SIZE:
+            _evict_source(next(iter(_source_cache)))
+        source_args = dict(source=file_path, cachefile=cachefile)
+        if "threads" in core.ffms2.Source.signature:
+            source_args["threads"] = 0
+        _source_cache[key] = core.ffms2.Source(**source_args)
+    return _source_cache[key]
+
+# -----------------------------------------------------------------------------
+# Pipeline Assembly Logic
+# -----------------------------------------------------------------------------
+
+# CLI quality levels mapped to QTGMC presets.
+QUALITY_PRESETS: Dict[str, str] = {
+    "placebo": "Placebo", "veryslow": "Very Slow", "slower": "Slower",
+    "slow": "Slow", "medium": "Medium", "fast": "Fast"
+}
+
+# QTGMC presets mapped to the nearest NoisePreset (which tops out at Slower).
+NOISE_PRESETS: Dict[str, str] = {
+    "Placebo": "Slower", "Very Slow": "Slower", "Slower": "Slower",
+    "Slow": "Slow", "Medium": "Medium", "Fast": "Fast"
+}
+
+# QTGMC graphs keyed by (source_id, tff, preset, pre-denoise, still, OpenCL
+# device), least recently used first. A few graphs are retained so a daemon
+# alternating between modes on the same window reuses them; older ones are
+# dropped so their MVTools state can be released.
+QTGMC_CACHE_SIZE = 4
+_qtgmc_cache: "OrderedDict[Tuple[str, bool, str, str, bool, int], vs.VideoNode]" = OrderedDict()
+
+# Temporal radius of QTGMC's final smoothing pass per preset, as havsfunc
+# sets it when TR2 is not given.
+QTGMC_PRESET_TR2: Dict[str, int] = {
+    "Placebo": 3, "Very Slow": 2, "Slower": 1, "Slow": 1, "Medium": 1, "Fast": 0
+}
+
+# Still-frame specialization: the sharpening/sharpness-limiting passes and a
+# final temporal smoothing (TR2) wider than 1 tune motion for playback and
+# are not visible in a single extracted frame. These only ever lower the
+# preset's values; TR0/TR1 feed motion analysis and stay with the preset.
+STILL_QTGMC_ARGS = dict(Sharpness=0.0, SMode=0, SLMode=0)
+STILL_MAX_TR2 = 1
+
+
+def deinterlace(
+    clip: vs.VideoNode,
+    source_id: str,
+    tff: bool,
+    preset: str,
+    prefilter: str,
+    still: bool,
+    gpu_device: int = 0,
+    ez_denoise: float = 0.0
+) -> vs.VideoNode:
+    """
+    Builds (or reuses) the QTGMC deinterlacing graph for a source window.
+    
+    Border=True prevents artifacts at frame boundaries. DCT=0 keeps MVTools on
+    plain spatial SAD, which is close in quality on camcorder footage and much
+    cheaper than the SATD modes. SourceMatch=3 and Lossless=2 each re-run parts
+    of QTGMC internally, so they are reserved for the Placebo preset.
+    
+    When nnedi3cl is available, QTGMC's NNEDI3 interpolation runs on the
+    OpenCL device gpu_device. TrueMotion=False keeps MVTools on its cheaper
+    non-truemotion search.
+    
+    A non-zero ez_denoise enables QTGMC's own FFT3D denoiser (EZDenoise),
+    which runs inside its motion-compensated pass rather than as a separate
+    filter in front of it.
+    """
+    key = (source_id, tff, preset, prefilter, still, gpu_device)
+    if key in _qtgmc_cache:
+        _qtgmc_cache.move_to_end(key)
+    else:
+        while len(_qtgmc_cache) >= QTGMC_CACHE_SIZE:
+            _qtgmc_cache.popitem(last=False)
+        extra = (
+            dict(STILL_QTGMC_ARGS, TR2=min(QTGMC_PRESET_TR2[preset], STILL_MAX_TR2))
+            if still else {}
+        )
+        if ez_denoise:
+            extra.update(
+                EZDenoise=ez_denoise, NoisePreset=NOISE_PRESETS[preset], Denoiser="fft3df"
+            )
+        placebo = preset == "Placebo"
+        _qtgmc_cache[key] = _havsfunc().QTGMC(
+            clip,
+            Preset=preset,
+            TFF=tff,
+            FPSDivisor=2,
+            InputType=0,
+            SourceMatch=3 if placebo else 1,
+            Lossless=2 if placebo else 0,
+            DCT=0,
+            TrueMotion=False,
+            ChromaMotion=True,
+            Border=True,
+            opencl=HAS_NNEDI3CL,
+            device=gpu_device,
+            **extra
+        )
+    return _qtgmc_cache[key]
+
+
+class PipelineBuilder:
+    """
+    Lazily assembles the processing stages for one output request.
+    
+    Each stage is a cached property built on first access, so a mode only
+    pays for the stages its output references (original mode never builds,
+    or imports, QTGMC) and stages shared by several composite quadrants are
+    built once.
+    """
+
+    def __init__(
+        self,
+        video: vs.VideoNode,
+        source_id: str,
+        quality: str,
+        tff: bool,
+        denoise: str,
+        stabilize: bool,
+        scale: int,
+        resizer: str,
+        denoise_stage: str,
+        denoiser: str,
+        target: str,
+        gpu_device: int
+    ) -> None:
+        self.raw = video
+        self.source_id = source_id
+        self.tff = tff
+        self.denoise = denoise
+        self.stabilize = stabilize
+        self.scale = scale
+        self.resizer = resizer
+        self.denoise_stage = denoise_stage
+        self.denoiser = denoiser
+        self.gpu_device = gpu_device
+
+        # Canonical Preset handling: stills drop the temporal passes that only
+        # pay off in motion (the Fast preview preset is left untouched).
+        self.fast = quality == "fast"
+        self.still = target == "still" and not self.fast
+        self.preset = QUALITY_PRESETS[quality]
+        self.field_str = "TFF" if tff else "BFF"
+
+        # Every output (and every composite quadrant) shares the source width
+        # and scale factor, so the RGB matrix is fixed for the whole graph.
+        self.matrix = detect_matrix(video.width * scale)
+
+    # -- Stages ---------------------------------------------------------------
+
+    @functools.cached_property
+    def denoised_pre(self) -> vs.VideoNode:
+        """Stage 1: Optional PRE denoise (Improves QTGMC motion vectors)."""
+        if self.denoise_stage != "pre":
+            return self.raw
+        if self.denoise != "none":
+            logger.info(f"Applying {self.denoise} noise reduction (PRE-deinterlacing stage)")
+        return apply_noise_reduction(self.raw, self.denoise, self.denoiser, self.gpu_device)
+
+    @functools.cached_property
+    def deinterlaced(self) -> vs.VideoNode:
+        """
+        Stage 2: Deinterlacing (QTGMC with edge preservation).
+        
+        A PRE FFT3D denoise is folded into QTGMC itself instead of running
+        ahead of it; the dfttest2 backends have no QTGMC equivalent and still
+        prefilter.
+        """
+        if self.denoise_stage == "pre" and self.denoiser == "fft3d" and self.denoise != "none":
+            logger.info(f"Applying {self.denoise} noise reduction (PRE-deinterlacing stage, QTGMC EZDenoise)")
+            return deinterlace(
+                self.raw, self.source_id, self.tff, self.preset, f"ez:{self.denoise}",
+                self.still, self.gpu_device, ez_denoise=_STRENGTH_MAP[self.denoise]
+            )
+        return deinterlace(
+            self.denoised_pre, self.source_id, self.tff, self.preset,
+            f"{self.denoiser}:{self.denoise}" if self.denoise_stage == "pre" else "none",
+            self.still, self.gpu_device
+        )
+
+    @functools.cached_property
+    def denoised_post(self) -> vs.VideoNode:
+        """Stage 3: Optional POST denoise (Alternative for specific sources)."""
+        if self.denoise_stage != "post":
+            return self.deinterlaced
+        if self.denoise != "none":
+            logger.info(f"Applying {self.denoise} noise reduction (POST-deinterlacing stage)")
+        return apply_noise_reduction(
+            self.deinterlaced, self.denoise, self.denoiser, self.gpu_device
+        )
+
+    @functools.cached_property
+    def stabilized(self) -> vs.VideoNode:
+        """Stage 4: Stabilization."""
+        return apply_stabilization(self.denoised_post, self.stabilize)
+
+    # -- Output Helpers -------------------------------------------------------
+
+    def scale_node(self, c: vs.VideoNode, rgb: bool = True) -> vs.VideoNode:
+        """
+        Scales a clip to the output size, converting to RGB24 in the same pass.
+        
+        Spatial scaling and the RGB24 conversion share a single resize call so
+        each output frame takes one pass, not two. With rgb=False the clip is
+        only scaled and stays in YUV.
+        """
+        scale, resizer = self.scale, self.resizer
+        w, h = c.width * scale, c.height * scale
+        rgb_args = dict(format=vs.RGB24, matrix_in_s=self.matrix) if rgb else {}
+        if scale == 1:
+            return core.resize.Bicubic(c, **rgb_args)
+        logger.info(f"Scaling output to {w}x{h} using {resizer}")
+        if resizer == "nnedi3_resample":
+            nn_args = dict(nsize=0, nns=2, qual=1)
+            if not HAS_NNEDI3CL:
+                # On CPU, prefer the upstream nnedi3_resample wrapper: it
+                # corrects nnedi3's half-pixel shift and chroma placement in
+                # the same fmtconv resample that reaches the target size.
+                try:
+                    from nnedi3_resample import nnedi3_resample
+                except ImportError:
+                    pass
+                else:
+                    c = nnedi3_resample(c, w, h, **nn_args)
+                    return core.resize.Bicubic(c, **rgb_args)
+
+            # One nnedi3 doubling per power of two in the scale factor; the
+            # trailing resize converts to RGB and covers any remaining scale.
+            # The OpenCL build runs the predictor on the GPU when present;
+            # on CPU, pscrn=4 is znedi3's most aggressive integer prescreener.
+            nn_args.update(field=0, dh=True)
+            if HAS_NNEDI3CL:
+                logger.info(f"Using nnedi3cl (OpenCL device {self.gpu_device}) for upscaling")
+                nnedi3 = core.nnedi3cl.NNEDI3CL
+                nn_args["device"] = self.gpu_device
+            else:
+                nnedi3 = core.znedi3.nnedi3
+                nn_args["pscrn"] = 1 if c.format.sample_type == vs.FLOAT else 4
+            for _ in range(int(math.log2(scale))):
+                c = nnedi3(c, **nn_args)
+                c = core.std.Transpose(c)
+                c = nnedi3(c, **nn_args)
+                c = core.std.Transpose(c)
+            return core.resize.Bicubic(c, width=w, height=h, **rgb_args)
+        elif resizer == "spline64":
+            # fmtconv's SIMD resampler: far cheaper than nnedi3 and close to
+            # it on smooth camcorder footage. It cannot change colour family,
+            # so the RGB24 conversion follows at the target size.
+            c = core.fmtc.resample(c, w=w, h=h, kernel="spline64")
+            return core.resize.Bicubic(c, **rgb_args)
+        elif resizer == "lanczos":
+            return core.resize.Lanczos(c, width=w, height=h, **rgb_args)
+        return core.resize.Bicubic(c, width=w, height=h, **rgb_args)
+
+    def grid(self, quads: List[Tuple[vs.VideoNode, str]]) -> vs.VideoNode:
+        """
+        Assembles a labelled 2x2 composite grid.
+        
+        Labels are drawn on the scaled YUV quadrants and the stacked grid is
+        converted to RGB24 once with the shared matrix.
+        """
+        q = [core.text.Text(self.scale_node(c, rgb=False), lbl) for c, lbl in quads]
+        top = core.std.StackHorizontal(q[:2])
+        bot = core.std.StackHorizontal(q[2:])
+        return core.resize.Bicubic(
+            core.std.StackVertical([top, bot]),
+            format=vs.RGB24, matrix_in_s=self.matrix
+        )
+
+    # -- Mode Outputs ---------------------------------------------------------
+
+    def build_original(self) -> Tuple[vs.VideoNode, str, bool]:
+        return self.scale_node(self.raw), "Original", False
+
+    def build_deint(self) -> Tuple[vs.VideoNode, str, bool]:
+        return self.scale_node(self.deinterlaced), f"Deint{self.preset.replace(' ', '')}", False
+
+    def build_single(self) -> Tuple[vs.VideoNode, str, bool]:
+        parts = [f"Deint{self.preset.replace(' ', '')}"]
+        if self.denoise != "none":
+            parts.append(f"DN{self.denoise.capitalize()}{self.denoise_stage.capitalize()}")
+        if self.stabilize:
+            parts.append("Stab")
+        return self.scale_node(self.stabilized), "".join(parts), False
+
+    def build_composite(self) -> Tuple[vs.VideoNode, str, bool]:
+        denoise, stage, field_str = self.denoise, self.denoise_stage, self.field_str
+
+        # Fast preview: a per-field bob stands in for QTGMC, keeping the first
+        # field of each frame so indices line up with the raw quadrant.
+        if self.fast:
+            logger.warning("Composite grid uses a plain bob instead of QTGMC when --fast is used.")
+            v_bob = core.resize.Bob(self.raw, tff=self.tff)[::2]
+            v_bob_dn = (
+                core.resize.Bob(self.denoised_pre, tff=self.tff)[::2] if stage == "pre"
+                else apply_noise_reduction(v_bob, denoise, self.denoiser, self.gpu_device)
+            )
+            return self.grid([
+                (self.raw, f"1. ORIGINAL ({field_str})"),
+                (v_bob, f"2. BOB ({field_str})"),
+                (v_bob_dn, f"3. BOB + DN ({denoise}, {stage})"),
+                (apply_stabilization(v_bob_dn, self.stabilize), "4. ALL + STAB"),
+            ]), "PriorityGridFast", True
+
+        return self.grid([
+            (self.raw, f"1. ORIGINAL ({field_str})"),
+            (self.deinterlaced, f"2. DE-INT (QTGMC {self.preset}, {field_str})"),
+            (self.denoised_post, f"3. DE-INT + DN ({denoise}, {stage})"),
+            (self.stabilized, "4. ALL + STAB"),
+        ]), "PriorityGrid", True
+
+    def build(self, mode: str) -> Tuple[vs.VideoNode, str, bool]:
+        """Dispatches to the output builder for a mode."""
+        builders = {
+            "original": self.build_original,
+            "deint": self.build_deint,
+            "single": self.build_single,
+            "composite": self.build_composite,
+        }
+        return builders[mode]()
+
+
+def get_output_node(
+    video: vs.VideoNode,
+    source_id: str,
+    mode: str,
+    quality: str,
+    tff: bool,
+    denoise: str,
+    stabilize: bool,
+    scale: int,
+    resizer: str,
+    denoise_stage: str,
+    denoiser: str,
+    target: str,
+    gpu_device: int
+) -> Tuple[vs.VideoNode, str, bool]:
+    """
+    Constructs the VapourSynth processing graph based on the requested mode.
+    
+    Returns:
+        A tuple containing (processed_node, filename_suffix, is_grid_mode).
+    """
+    return PipelineBuilder(
+        video, source_id, quality, tff, denoise, stabilize, scale,
+        resizer, denoise_stage, denoiser, target, gpu_device
+    ).build(mode)
+
+# -----------------------------------------------------------------------------
+# Frame Extraction Loop
+# -----------------------------------------------------------------------------
+
+def process_frame(
+    file_path: str,
+    timestamp: str,
+    output_dir: str,
+    count: int,
+    step: int,
+    quality: str,
+    target_frame_num: Optional[int],
+    scale: int,
+    resizer: str,
+    mode: str,
+    tff_override: Optional[int],
+    denoise: str,
+    stabilize: bool,
+    denoise_stage: str,
+    denoiser: str,
+    target: str,
+    gpu_device: int,
+    sink: str,
+    png_compression: int,
+    host_input: Optional[str],
+    host_dir: Optional[str]
+) -> None:
+    """Primary entry point for frame extraction and archival output."""
+    base_fn = to_pascal_case(os.path.splitext(os.path.basename(file_path))[0])
+
+    # The ffms2 index lives in the output directory: the source directory may
+    # be a read-only mount, where ffms2 would silently re-index on every run.
+    # It is named after the full source basename, extension included, since
+    # base_fn collides for e.g. clip.mp4/clip.mkv sharing one output folder.
+    # A missing file surfaces as OSError (mtime lookup), an unreadable one
+    # as vs.Error from ffms2.
+    os.makedirs(output_dir, exist_ok=True)
+    index_path = os.path.join(output_dir, os.path.basename(file_path) + ".ffindex")
+    try:
+        mtime = os.path.getmtime(file_path)
+        video = open_source(file_path, mtime, index_path)
+    except (OSError, vs.Error) as e:
+        logger.error(f"Unable to open source {file_path}: {e}")
+        sys.exit(1)
+    run_ts = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+
+    # Target Frame Indexing Logic
+    if target_frame_num is not None:
+        start_frame = target_frame_num
+    else:
+        # Exact rational math against video.fps (a Fraction): float rates
+        # like 29.97002997 drift by a frame on long NTSC timestamps.
+        h, m, s = map(Fraction, timestamp.split(':'))
+        start_frame = math.floor((h * 3600 + m * 60 + s) * video.fps + Fraction(1, 2))
+
+    targets = [
+        idx for idx in (start_frame + i * step for i in range(count))
+        if idx < video.num_frames
+    ]
+    if not targets:
+        logger.error(f"Start frame {start_frame} is beyond the end of the source ({video.num_frames} frames).")
+        sys.exit(1)
+
+    # Field Order Detection with Transparency
+    if tff_override is not None:
+        tff = bool(tff_override)
+    else:
+        # Keyed by mtime as well, so a daemon notices a rewritten file
+        tff = detect_field_order(video, source_key(file_path, mtime))
+
+    # Decode Window: trim the source to the requested range plus enough padding
+    # for QTGMC's temporal radius (and MVTools tr=2) so ffms2 decodes one
+    # contiguous region instead of seeking from a keyframe for every target.
+    pad = 8
+    lo = max(0, targets[0] - pad)
+    hi = min(video.num_frames, targets[-1] + 1 + pad)
+    video = core.std.Trim(video, first=lo, last=hi - 1)
+
+    # Processing Depth: lift 8-bit sources to 16-bit once so QTGMC's MVTools
+    # and nnedi3 sub-filters share one bit depth instead of converting at each
+    # boundary. The final RGB24 conversion brings the output back to 8-bit.
+    if video.format.bits_per_sample == 8:
+        video = core.resize.Point(
+            video,
+            format=video.format.replace(bits_per_sample=16, sample_type=vs.INTEGER).id,
+            dither_type="none"
+        )
+
+    out_node, suffix, is_grid = get_output_node(
+        video, f"{source_key(file_path, mtime)}:{lo}-{hi}", mode, quality, tff,
+        denoise, stabilize, scale, resizer, denoise_stage, denoiser,
+        target, gpu_device
+    )
+
+    # One asynchronous request pump lets the VS thread pool pipeline QTGMC's
+    # motion analysis and output encoding across neighbouring frames. PNG
+    # encodes run inside the writer node, i.e. on the same pool, so no
+    # separate Python executor is needed for them.
+    # Prefetch is capped at the batch size so short runs don't over-request.
+    # Targets are evenly spaced, so one Trim + SelectEvery selects them all.
+    window = slice(targets[0] - lo, targets[-1] - lo + 1)
+    saved_dir = host_dir or output_dir
+
+    if sink == "pipe":
+        # Streamed Output: every target frame goes into a single lossless MKV.
+        # x264 runs its own thread pool outside VapourSynth, so the cores are
+        # split between the two rather than oversubscribing the machine.
+        cpus = os.cpu_count() or 1
+        encoder_threads = max(1, cpus // 4)
+        core.num_threads = max(2, cpus - encoder_threads)
+        prefetch = min(len(targets), core.num_threads)
+
+        name = f"{base_fn}_F{targets[0]:06d}_{suffix}_{run_ts}.mkv"
+        try:
+            batch = core.std.SelectEvery(out_node[window], cycle=step, offsets=[0])
+            pipe_to_ffmpeg(
+                batch, os.path.join(output_dir, name),
+                prefetch, core.num_threads, encoder_threads
+            )
+            logger.info(f"Saved: {os.path.join(saved_dir, name)} ({len(targets)} frames)")
+        except Exception as e:
+            logger.error(f"Failed to stream frames to ffmpeg: {e}")
+    else:
+        # Batched Output: a single writer node over the whole graph, sampled at
+        # the target indices. firstnum=lo makes the writer's %06d counter
+        # reproduce the source frame index despite the trimmed decode window.
+        name = f"{base_fn}_F%06d_{suffix}_{run_ts}.png"
+        writer = png_writer(
+            out_node, os.path.join(output_dir, name),
+            firstnum=lo, compression=png_compression
+        )
+        prefetch = min(len(targets), core.num_threads)
+        try:
+            batch = core.std.SelectEvery(writer[window], cycle=step, offsets=[0])
+            frames = batch.frames(prefetch=prefetch, backlog=core.num_threads, close=True)
+            head, tail = os.path.join(saved_dir, name).split("%06d")
+            for idx, _ in zip(targets, frames):
+                logger.info(f"Saved: {head}{idx:06d}{tail}")
+        except Exception as e:
+            logger.error(f"Failed to write frames: {e}")
+
+    # --- Frame Discovery Guidance ---
+    if count > 1 and sink == "png":
+        print("\n" + "-" * 60)
+        print("BATCH EXTRACTION COMPLETE - FRAME DISCOVERY")
+        print("-" * 60)
+        print(f"1. Open folder: {host_dir or output_dir}")
+        print("2. Audit frames visually to find the sharpest image.")
+        print("3. Note the index (e.g., _F054644_) in the filename.")
+        print("4. Re-run with -f <index> -m single for final archival.")
+        print("-" * 60)
+
+    # Docker-Aware Suggestion Terminal Output
+    if mode == "composite" and quality != "fast":
+        print("\n" + "=" * 60)
+        print("COMPOSITE BREAKDOWN - INDIVIDUAL EXTRACTION COMMANDS")
+        print("=" * 60)
+        u_in = host_input or file_path
+        f_val = target_frame_num if target_frame_num is not None else timestamp
+        tff_flag = "" if tff_override is None else f" -t {int(tff)}"
+        
+        base = (
+            f"./process_video.sh -i \"{u_in}\" -f \"{f_val}\" -s {scale} -r {resizer} "
+            f"-q {quality} -T {target} -n {denoiser} -g {denoise_stage} -G {gpu_device}"
+        )
+        # Output options only when they differ from the wrapper's defaults
+        if sink != "png":
+            base += f" -k {sink}"
+        if png_compression != 1:
+            base += f" -l {png_compression}"
+        print(f"1. ORIGINAL:  {base} -m original{tff_flag}")
+        print(f"2. DE-INT:    {base} -m deint -d none{tff_flag}")
+        print(f"3. DE-INT+DN: {base} -m single -d {denoise}{tff_flag}")
+        print(f"4. FULL PIPE: {base} -m single -d {denoise} -x 1{tff_flag}")
+        print("=" * 60)
+
+# -----------------------------------------------------------------------------
+# CLI Argument Handling
+# -----------------------------------------------------------------------------
+
+def positive_int(value: str) -> int:
+    """argparse type for frame steps: SelectEvery needs a cycle of at least 1."""
+    n = int(value)
+    if n < 1:
+        raise argparse.ArgumentTypeError(f"must be a positive integer, got {n}")
+    return n
+
+
+def build_argparser() -> argparse.ArgumentParser:
+    """Builds the command-line parser shared by the CLI entry point."""
+    p = argparse.ArgumentParser(description="Professional Archival Reconstruction CLI")
+    p.add_argument("--input", required=True)
+    p.add_argument("--time", default="00:00:00.000")
+    p.add_argument("--out", default="output")
+    p.add_argument("--host-dir")
+    p.add_argument("--host-input")
+    p.add_argument("--count", type=int, default=1)
+    p.add_argument("--step", type=positive_int, default=1)
+    p.add_argument("--fast", action="store_true")
+    p.add_argument("--quality", default="slower", choices=list(QUALITY_PRESETS))
+    p.add_argument("--frame", type=int)
+    p.add_argument("--scale", type=int, default=1)
+    p.add_argument("--resizer", default="bicubic", choices=["bicubic", "lanczos", "spline64", "nnedi3_resample"])
+    p.add_argument("--mode", default="composite", choices=["composite", "original", "single", "deint"])
+    p.add_argument("--tff", type=int, choices=[0, 1])
+    p.add_argument("--denoise", default="medium", choices=["none", "light", "medium", "heavy"])
+    p.add_argument("--denoise-stage", default="pre", choices=["pre", "post"])
+    p.add_argument("--denoiser", default="fft3d", choices=["fft3d", "dfttest2_cuda", "dfttest2_cpu"])
+    p.add_argument("--stabilize", type=int, default=0)
+    p.add_argument("--target", default="still", choices=["still", "video"])
+    p.add_argument("--gpu-device", type=int, default=0)
+    p.add_argument("--sink", default="png", choices=["png", "pipe"])
+    p.add_argument("--png-compression", type=int, default=1, choices=range(1, 10))
+    return p
+
+
+def process_args(a: argparse.Namespace) -> None:
+    """Runs one extraction from parsed command-line arguments."""
+    process_frame(
+        file_path=a.input, timestamp=a.time, output_dir=a.out,
+        count=a.count, step=a.step, quality="fast" if a.fast else a.quality,
+        target_frame_num=a.frame, scale=a.scale, resizer=a.resizer,
+        mode=a.mode, tff_override=a.tff, denoise=a.denoise,
+        stabilize=bool(a.stabilize), denoise_stage=a.denoise_stage,
+        denoiser=a.denoiser, target=a.target, gpu_device=a.gpu_device,
+        sink=a.sink, png_compression=a.png_compression,
+        host_input=a.host_input, host_dir=a.host_dir
+    )
@@ -0,0 +1,76 @@
+"""
+Persistent extraction server for the Video Reconstruction Engine.
+
+Keeps one Python process, the VapourSynth core, havsfunc and the opened
+ffms2 sources alive across requests. Clients connect to a Unix socket and
+send a single line holding a JSON list of CLI arguments (the same ones
+process_video.py accepts); log output and printed guidance are streamed
+back on the same connection. The last line is EXIT_MARKER followed by the
+request's exit status, after which the connection is closed.
+"""
+
+import json
+import logging
+import os
+import socket
+import sys
+
+from ._core import LOG_FORMAT, build_argparser, core, process_args
+
+logger = logging.getLogger(__name__)
+
+# Prefix of the final status line sent for every request
+EXIT_MARKER = "__PROCESS_VIDEO_EXIT__"
+
+
+def _handle(stream) -> None:
+    """Runs one request, redirecting logs and stdout to the client stream."""
+    handler = logging.StreamHandler(stream)
+    handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    root = logging.getLogger()
+    root.addHandler(handler)
+    saved = sys.stdout, sys.stderr
+    sys.stdout = sys.stderr = stream
+    status = 0
+    try:
+        line = stream.readline()
+        if not line.strip():
+            # Liveness probe (nc -z) or a client that hung up early
+            return
+        argv = json.loads(line)
+        # The pipe sink lowers the VS thread count for the encoder
+        core.num_threads = os.cpu_count()
+        process_args(build_argparser().parse_args(argv))
+    except SystemExit as e:
+        # argparse errors and process_frame aborts end this request only,
+        # with the status a one-shot run would have exited with
+        status = e.code if isinstance(e.code, int) else int(e.code is not None)
+    except Exception:
+        logger.exception("Request failed")
+        status = 1
+    finally:
+        sys.stdout, sys.stderr = saved
+        root.removeHandler(handler)
+    stream.write(f"{EXIT_MARKER} {status}\n")
+
+
+def serve(socket_path: str) -> None:
+    """Serves extraction requests on a Unix socket until interrupted."""
+    if os.path.exists(socket_path):
+        os.unlink(socket_path)
+    srv = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    srv.bind(socket_path)
+    srv.listen(8)
+    logger.info(f"Daemon listening on {socket_path}")
+    try:
+        # Requests run one at a time: the VS graph caches are not thread-safe
+        while True:
+            conn, _ = srv.accept()
+            try:
+                with conn, conn.makefile("rw", encoding="utf-8", buffering=1) as stream:
+                    _handle(stream)
+            except OSError as e:
+                logger.warning(f"Client connection lost: {e}")
+    finally:
+        srv.close()
+        os.unlink(socket_path)